@@ -1,8 +1,9 @@
-from flask import Flask, Response, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g, send_from_directory
 from flask_cors import CORS, cross_origin
 from flask_bcrypt import Bcrypt
 import cv2
 import time
+import math
 import threading
 import base64
 import json
@@ -12,6 +13,14 @@ from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 import random
+import queue
+import glob
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+from dataclasses import dataclass, fields, replace, asdict
+from typing import Optional
 from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
 import sqlite3
 import secrets
@@ -33,31 +42,264 @@ monitoring_active = False
 processing_paused = False
 latest_frame = None
 recent_alerts = []
-ALERT_THRESHOLD = 10
 frame_lock = threading.Lock()
 alerts_lock = threading.Lock()
-config_lock = threading.Lock()
 
 # --- Configuração de E-mail de Recuperação ---
 CONFIG_FILE = 'config.json'
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
-
-# Carregar configuração inicial
-app_config = load_config()
 RECOVERY_EMAIL = os.environ.get('RECOVERY_EMAIL')
 SMTP_SERVER = os.environ.get('SMTP_SERVER')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '465'))
 SMTP_USER = os.environ.get('SMTP_USER')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
 
+# --- Configuração do Classificador de Objetos (opcional) ---
+# Se OBJECT_MODEL_PATH não for definido, os alertas continuam sendo gerados apenas pelo movimento.
+OBJECT_MODEL_PATH = os.environ.get('OBJECT_MODEL_PATH')
+OBJECT_CONFIG_PATH = os.environ.get('OBJECT_CONFIG_PATH', '') # .prototxt/.pbtxt para modelos Caffe/TensorFlow
+OBJECT_LABELS_FILE = os.environ.get('OBJECT_LABELS_FILE')
+OBJECT_ALERT_CLASSES = tuple(c.strip() for c in os.environ.get('OBJECT_ALERT_CLASSES', 'person,car,bus,motorbike,bicycle,truck').split(',') if c.strip())
+OBJECT_CONFIDENCE = float(os.environ.get('OBJECT_CONFIDENCE', '0.5'))
+OBJECT_INPUT_SIZE = int(os.environ.get('OBJECT_INPUT_SIZE', '300'))
+OBJECT_SCALE = float(os.environ.get('OBJECT_SCALE', str(1 / 127.5)))
+OBJECT_MEAN = float(os.environ.get('OBJECT_MEAN', '127.5'))
+OBJECT_SWAP_RB = os.environ.get('OBJECT_SWAP_RB', '0') == '1'
+OBJECT_MAX_CROPS = int(os.environ.get('OBJECT_MAX_CROPS', '8'))
+# Classes do MobileNet-SSD (PASCAL VOC), usadas quando OBJECT_LABELS_FILE não é informado
+DEFAULT_OBJECT_LABELS = ['background', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat', 'chair',
+                         'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person', 'pottedplant', 'sheep', 'sofa',
+                         'train', 'tvmonitor']
+
+# --- Configuração da Transmissão HLS (opcional) ---
+# Codifica o feed uma única vez em H.264 (segmentos fMP4) com o ffmpeg, servido em /live/index.m3u8.
+# Consome bem menos banda por espectador que o MJPEG do /video_feed.
+HLS_ENABLED = os.environ.get('HLS_ENABLED', '0') == '1'
+HLS_DIR = os.environ.get('HLS_DIR', os.path.join(tempfile.gettempdir(), 'vigia-hls'))
+HLS_PLAYLIST = 'index.m3u8'
+HLS_FPS = int(os.environ.get('HLS_FPS', '15'))
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '2'))
+HLS_LIST_SIZE = int(os.environ.get('HLS_LIST_SIZE', '5'))
+HLS_BITRATE = os.environ.get('HLS_BITRATE', '800k')
+HLS_WIDTH = int(os.environ.get('HLS_WIDTH', '0')) # 0 mantém a resolução da câmera
+if HLS_ENABLED and (HLS_FPS <= 0 or HLS_SEGMENT_SECONDS <= 0 or HLS_LIST_SIZE <= 0):
+    raise RuntimeError("HLS_FPS, HLS_SEGMENT_SECONDS e HLS_LIST_SIZE devem ser maiores que zero!")
+# Arquivos gerados pelo encoder; só eles são apagados de HLS_DIR
+HLS_FILE_PATTERNS = (HLS_PLAYLIST, f'{HLS_PLAYLIST}.tmp', 'init.mp4', 'segment_*.m4s')
+HLS_MIMETYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.m4s': 'video/iso.segment', '.mp4': 'video/mp4'}
+
+# --- Configurações em Tempo de Execução ---
+# Parâmetros do detector que podem ser ajustados pelo endpoint /detector_settings
+DETECTOR_FIELDS = ('alert_threshold', 'alert_cooldown', 'pixel_threshold', 'blur_kernel', 'min_area',
+                   'score_normalizer', 'dilate_iterations', 'object_confidence', 'object_alert_classes')
+
+@dataclass(frozen=True)
+class Settings:
+    """Snapshot imutável das configurações. Uma nova instância é publicada a cada alteração."""
+    alert_threshold: int = 10 # Score mínimo (0-100) para gerar alerta
+    alert_cooldown: float = 5.0 # Segundos de espera entre alertas
+    pixel_threshold: int = 25 # Diferença mínima de intensidade para um pixel contar como movimento
+    blur_kernel: int = 21 # Tamanho do kernel do GaussianBlur (ímpar)
+    min_area: int = 500 # Área mínima de um contorno de movimento
+    score_normalizer: float = 50000.0 # Área de contorno equivalente a score 100
+    dilate_iterations: int = 2
+    object_confidence: float = OBJECT_CONFIDENCE
+    object_alert_classes: tuple = OBJECT_ALERT_CLASSES
+    recovery_email: Optional[str] = None
+    smtp_server: str = ''
+    smtp_port: int = 465
+    smtp_user: str = ''
+    smtp_password: str = ''
+
+    def __post_init__(self):
+        for field in fields(self):
+            if field.type is float and not math.isfinite(getattr(self, field.name)):
+                raise ValueError(f"{field.name} must be a finite number")
+        if not 0 <= self.alert_threshold <= 100:
+            raise ValueError("alert_threshold must be between 0 and 100")
+        if self.alert_cooldown < 0:
+            raise ValueError("alert_cooldown must be >= 0")
+        if not 0 <= self.pixel_threshold <= 255:
+            raise ValueError("pixel_threshold must be between 0 and 255")
+        if not 1 <= self.blur_kernel <= 99 or self.blur_kernel % 2 == 0:
+            raise ValueError("blur_kernel must be an odd number between 1 and 99")
+        if self.min_area < 0:
+            raise ValueError("min_area must be >= 0")
+        if self.score_normalizer <= 0:
+            raise ValueError("score_normalizer must be > 0")
+        if not 0 <= self.dilate_iterations <= 20:
+            raise ValueError("dilate_iterations must be between 0 and 20")
+        if not 0 <= self.object_confidence <= 1:
+            raise ValueError("object_confidence must be between 0 and 1")
+        if not self.object_alert_classes:
+            raise ValueError("object_alert_classes must not be empty")
+
+    @staticmethod
+    def coerce(name, field_type, value):
+        # Números podem vir como string (ex.: smtp_port salvo pelo frontend), mas nunca como bool
+        # e campos inteiros não aceitam parte fracionária
+        if isinstance(value, bool):
+            raise TypeError(f"{name} must not be a boolean")
+        if field_type is int:
+            if isinstance(value, float):
+                if not value.is_integer():
+                    raise ValueError(f"{name} must be an integer")
+                return int(value)
+            if isinstance(value, (int, str)):
+                return int(value)
+            raise TypeError(f"{name} must be an integer")
+        if field_type is float:
+            if isinstance(value, (int, float, str)):
+                return float(value)
+            raise TypeError(f"{name} must be a number")
+        if field_type is tuple:
+            if isinstance(value, str):
+                value = value.split(',')
+            if not isinstance(value, (list, tuple)) or not all(isinstance(c, str) for c in value):
+                raise TypeError(f"{name} must be a list of strings")
+            return tuple(c.strip() for c in value if c.strip())
+        # Campos de texto; recovery_email também aceita None
+        if isinstance(value, str) or (value is None and field_type == Optional[str]):
+            return value
+        raise TypeError(f"{name} must be a string")
+
+    @classmethod
+    def from_dict(cls, data, base=None):
+        # Converte os valores vindos do JSON para o tipo de cada campo; chaves desconhecidas são ignoradas
+        changes = {}
+        for field in fields(cls):
+            if field.name in data:
+                changes[field.name] = cls.coerce(field.name, field.type, data[field.name])
+        return replace(base or cls(), **changes)
+
+    def detector(self):
+        return {name: getattr(self, name) for name in DETECTOR_FIELDS}
+
+class SettingsStore:
+    """Guarda as configurações em CONFIG_FILE e publica snapshots imutáveis.
+
+    A leitura (`settings_store.snapshot`) é uma simples troca de referência e não precisa de lock,
+    então o loop da câmera pode ler as configurações a cada frame sem contenção. As escritas são
+    atômicas (arquivo temporário + rename) e o arquivo é recarregado se for alterado externamente.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.write_lock = threading.Lock()
+        self.subscribers = []
+        self.mtime = None
+        self.snapshot = Settings()
+        try:
+            self.snapshot = self.read(self.snapshot)
+        except (ValueError, TypeError) as e:
+            print(f"Erro ao carregar {self.path}, usando configurações padrão: {e}")
+
+    def backup(self):
+        # Guarda o arquivo do usuário antes que a próxima escrita o substitua
+        backup_path = f"{self.path}.bak"
+        try:
+            shutil.copy2(self.path, backup_path)
+            print(f"Cópia de {self.path} salva em {backup_path}.")
+        except OSError as e:
+            print(f"Erro ao salvar a cópia de {self.path}: {e}")
+
+    def read(self, base):
+        # Carrega campo a campo: um valor inválido mantém o valor de `base` sem descartar os demais
+        if not os.path.exists(self.path):
+            return base
+        self.mtime = os.stat(self.path).st_mtime_ns
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{self.path} must contain a JSON object")
+        except ValueError:
+            self.backup()
+            raise
+
+        settings = base
+        invalid = []
+        for key, value in data.items():
+            try:
+                settings = Settings.from_dict({key: value}, settings)
+            except (ValueError, TypeError) as e:
+                invalid.append(key)
+                print(f"Valor inválido para '{key}' em {self.path}, mantendo {getattr(settings, key, None)!r}: {e}")
+        if invalid:
+            self.backup()
+        return settings
+
+    def write(self, settings):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(asdict(settings), f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # O arquivo original continua intacto; só descarta o temporário
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    def subscribe(self, callback):
+        # callback(antigo, novo) é chamado sempre que um novo snapshot é publicado
+        self.subscribers.append(callback)
+
+    def publish(self, settings):
+        old, self.snapshot = self.snapshot, settings
+        for callback in self.subscribers:
+            try:
+                callback(old, settings)
+            except Exception as e:
+                print(f"DEBUG: Erro ao notificar mudança de configuração: {e}")
+
+    def update(self, **changes):
+        # Valida antes de gravar; ValueError/TypeError são propagados para quem chamou
+        with self.write_lock:
+            settings = Settings.from_dict(changes, self.snapshot)
+            self.write(settings)
+            self.publish(settings)
+        return settings
+
+    def reload(self):
+        with self.write_lock:
+            try:
+                if os.stat(self.path).st_mtime_ns == self.mtime:
+                    return
+                settings = self.read(self.snapshot)
+            except FileNotFoundError:
+                return
+            except (ValueError, TypeError) as e:
+                print(f"Configuração inválida em {self.path}, mantendo a anterior: {e}")
+                return
+            print(f"Configurações recarregadas de {self.path}.")
+            self.publish(settings)
+
+    def watch(self, interval=1.0):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.reload()
+        threading.Thread(target=loop, daemon=True).start()
+
+settings_store = SettingsStore(CONFIG_FILE)
+# Precedência do e-mail de recuperação: a variável de ambiente RECOVERY_EMAIL vale na inicialização e
+# nos recarregamentos do config.json; sem ela, vale o e-mail salvo no config.json. Uma alteração feita
+# pelo /update_recovery_email sempre é aplicada.
+RECOVERY_EMAIL = RECOVERY_EMAIL or settings_store.snapshot.recovery_email
+
+def on_settings_changed(old, new):
+    global RECOVERY_EMAIL
+    changed = [f.name for f in fields(Settings) if getattr(old, f.name) != getattr(new, f.name)]
+    if 'recovery_email' in changed and new.recovery_email and not os.environ.get('RECOVERY_EMAIL'):
+        RECOVERY_EMAIL = new.recovery_email
+    if changed:
+        print(f"Configurações alteradas: {', '.join(changed)}")
+
+settings_store.subscribe(on_settings_changed)
+settings_store.watch()
+
 # --- Variáveis para Recuperação de Senha ---
 # password_reset_codes = {} # Não precisamos mais deste dicionário em memória
 
@@ -120,17 +362,283 @@ with app.app_context():
 
 # --------------------------------
 
+class ObjectClassifier(threading.Thread):
+    """Segundo estágio da detecção: classifica as regiões de movimento com um modelo cv2.dnn (somente CPU).
+
+    Roda em sua própria thread para nunca travar a captura. Recebe (frame, caixas) do CameraThread,
+    processa todos os recortes em um único lote e só confirma o alerta se alguma das classes
+    configuradas em `object_alert_classes` for encontrada.
+    """
+    def __init__(self, on_detection):
+        super().__init__()
+        self.daemon = True
+        self.on_detection = on_detection
+        # Fila de tamanho 1: se o classificador estiver ocupado, o pedido novo é descartado
+        self.requests = queue.Queue(maxsize=1)
+        self.running = True
+        # Muitos modelos exportados só aceitam lote de tamanho 1; nesse caso os recortes passam um por vez
+        self.batching = True
+        self.net = cv2.dnn.readNet(OBJECT_MODEL_PATH, OBJECT_CONFIG_PATH)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        if OBJECT_LABELS_FILE:
+            with open(OBJECT_LABELS_FILE, 'r') as f:
+                self.labels = [line.strip() for line in f if line.strip()]
+        else:
+            self.labels = DEFAULT_OBJECT_LABELS
+
+    def submit(self, frame, boxes, score, timestamp):
+        # Só o CameraThread enfileira, então se a fila não está cheia aqui o put_nowait não falha.
+        # A cópia do frame (compartilhado com o /video_feed) só é feita se o pedido for aceito.
+        if self.requests.full():
+            return False
+        self.requests.put_nowait((frame.copy(), boxes, score, timestamp))
+        return True
+
+    def stop(self):
+        self.running = False
+        try:
+            self.requests.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def run(self):
+        print("Thread do classificador de objetos iniciado.")
+        while self.running:
+            item = self.requests.get()
+            if item is None:
+                break
+            frame, boxes, score, timestamp = item
+            settings = settings_store.snapshot
+            try:
+                detections = self.classify(frame, boxes, settings.object_confidence)
+            except Exception as e:
+                # Na dúvida, alerta: uma falha do classificador não pode silenciar a câmera
+                print(f"Erro no classificador de objetos, gerando alerta apenas por movimento: {e}")
+                for (x, y, w, h) in boxes:
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                self.on_detection(frame, score, timestamp)
+                continue
+
+            matches = [(box, label, conf) for box, label, conf in detections if label in settings.object_alert_classes]
+            if not matches:
+                print(f"DEBUG: Movimento descartado pelo classificador (detectado: {[d[1] for d in detections]})")
+                continue
+
+            for (x, y, w, h), label, conf in matches:
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+                cv2.putText(frame, f"{label} {conf:.2f}", (x, max(y - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            self.on_detection(frame, score, timestamp, sorted({label for _, label, _ in matches}))
+        print("Thread do classificador de objetos finalizado.")
+
+    def classify(self, frame, boxes, min_confidence):
+        frame_h, frame_w = frame.shape[:2]
+        # Os maiores recortes primeiro, limitados a OBJECT_MAX_CROPS por lote
+        boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)[:OBJECT_MAX_CROPS]
+        crops, regions = [], []
+        for (x, y, w, h) in boxes:
+            # Margem de 10% em volta da caixa, já que o movimento costuma cobrir só parte do objeto
+            pad_x, pad_y = int(w * 0.1), int(h * 0.1)
+            x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+            x1, y1 = min(x + w + pad_x, frame_w), min(y + h + pad_y, frame_h)
+            crops.append(frame[y0:y1, x0:x1])
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+
+        # Para cada recorte, mantém a detecção de maior confiança de cada classe
+        best = {}
+        for crop_index, class_id, confidence in self.detect(crops):
+            if confidence < min_confidence or not 0 <= class_id < len(self.labels):
+                continue
+            key = (crop_index, self.labels[class_id])
+            if confidence > best.get(key, 0):
+                best[key] = confidence
+        return [(regions[i], label, conf) for (i, label), conf in best.items()]
+
+    def forward(self, crops):
+        blob = cv2.dnn.blobFromImages(crops, OBJECT_SCALE, (OBJECT_INPUT_SIZE, OBJECT_INPUT_SIZE),
+                                      (OBJECT_MEAN, OBJECT_MEAN, OBJECT_MEAN), swapRB=OBJECT_SWAP_RB, crop=False)
+        self.net.setInput(blob)
+        return list(self.parse_output(self.net.forward(), len(crops)))
+
+    def detect(self, crops):
+        if self.batching and len(crops) > 1:
+            try:
+                return self.forward(crops)
+            except (cv2.error, ValueError) as e:
+                print(f"Modelo não aceita lotes, classificando um recorte por vez: {e}")
+                self.batching = False
+        detections = []
+        for crop_index, crop in enumerate(crops):
+            detections += [(crop_index, class_id, conf) for _, class_id, conf in self.forward([crop])]
+        return detections
+
+    def parse_output(self, output, batch_size):
+        # Saída estilo SSD (DetectionOutput): [1, 1, N, 7] -> [índice do recorte, classe, confiança, x1, y1, x2, y2]
+        if output.ndim == 4 and output.shape[-1] == 7:
+            for det in output.reshape(-1, 7):
+                crop_index = int(det[0])
+                # Linhas de preenchimento vêm com índice -1
+                if 0 <= crop_index < batch_size:
+                    yield crop_index, int(det[1]), float(det[2])
+            return
+        # Saída estilo YOLO (v5/v8): [lote, 4 + classes, âncoras] ou [lote, âncoras, 4 + classes]
+        output = output.reshape(batch_size, output.shape[-2], output.shape[-1])
+        for crop_index, preds in enumerate(output):
+            if preds.shape[0] < preds.shape[1]:
+                preds = preds.T
+            scores = preds[:, 4:]
+            if scores.shape[1] == len(self.labels) + 1:
+                # YOLOv5 inclui a confiança do objeto na coluna 4
+                scores = scores[:, 1:] * scores[:, :1]
+            class_ids = np.argmax(scores, axis=1)
+            confidences = scores[np.arange(len(class_ids)), class_ids]
+            for class_id in np.unique(class_ids):
+                yield crop_index, int(class_id), float(confidences[class_ids == class_id].max())
+
+class HlsEncoder(threading.Thread):
+    """Alimenta um processo ffmpeg com os frames publicados em latest_frame a uma taxa fixa (HLS_FPS).
+
+    O ffmpeg mantém em HLS_DIR uma janela de HLS_LIST_SIZE segmentos; todos os espectadores de
+    /live compartilham esse único encoder.
+    """
+    def __init__(self, width, height):
+        super().__init__()
+        self.daemon = True
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8) # Buffer próprio, copiado sob frame_lock
+        self.running = True
+        self.process = None
+
+    def start_ffmpeg(self):
+        # Descarta os segmentos de uma execução anterior, sem tocar em outros arquivos de HLS_DIR
+        os.makedirs(HLS_DIR, exist_ok=True)
+        for pattern in HLS_FILE_PATTERNS:
+            for path in glob.glob(os.path.join(glob.escape(HLS_DIR), pattern)):
+                os.remove(path)
+        gop = HLS_FPS * HLS_SEGMENT_SECONDS # Um keyframe no início de cada segmento
+        command = [
+            'ffmpeg', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}', '-r', str(HLS_FPS), '-i', '-',
+        ]
+        if HLS_WIDTH:
+            command += ['-vf', f'scale={HLS_WIDTH}:-2']
+        command += [
+            '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+            '-b:v', HLS_BITRATE, '-maxrate', HLS_BITRATE, '-bufsize', HLS_BITRATE,
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_list_size', str(HLS_LIST_SIZE),
+            '-hls_flags', 'delete_segments+independent_segments',
+            '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+            '-hls_segment_filename', os.path.join(HLS_DIR, 'segment_%05d.m4s'),
+            os.path.join(HLS_DIR, HLS_PLAYLIST),
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def stop(self, timeout=5):
+        self.running = False
+        self.join(timeout)
+        if self.is_alive():
+            # O ffmpeg parou de ler o stdin e a escrita no pipe está bloqueada; matar o processo a libera
+            print("Encoder HLS não respondeu, finalizando o ffmpeg.")
+            self.process.kill()
+            self.join()
+
+    def run(self):
+        print(f"Thread do encoder HLS iniciado ({self.width}x{self.height} @ {HLS_FPS} fps, {HLS_BITRATE}).")
+        interval = 1.0 / HLS_FPS
+        next_time = time.time()
+        while self.running and monitoring_active:
+            with frame_lock:
+                if latest_frame is not None:
+                    if latest_frame.shape == self.frame.shape:
+                        np.copyto(self.frame, latest_frame)
+                    else:
+                        cv2.resize(latest_frame, (self.width, self.height), dst=self.frame)
+            # A escrita no pipe pode bloquear, por isso é feita fora do frame_lock
+            try:
+                self.process.stdin.write(self.frame.data)
+            except (BrokenPipeError, OSError) as e:
+                print(f"Erro: encoder HLS finalizado inesperadamente: {e}")
+                break
+
+            # Taxa constante: se a câmera for mais lenta, o último frame é repetido
+            next_time += interval
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.time()
+
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        print("Thread do encoder HLS finalizado.")
+
 class CameraThread(threading.Thread):
     def __init__(self):
         super().__init__()
         self.daemon = True
         self.camera = None
-        self.last_frame_gray = None
+        self.classifier = None
+        self.hls_encoder = None
+        # Buffers pré-alocados, reutilizados a cada frame para evitar alocações no loop
+        self.capture_buffers = [None, None] # Double buffer da captura: um publicado, outro recebendo a leitura
+        self.capture_index = 0
+        self.gray = None
+        self.blurred = [None, None] # [frame de referência, frame atual], rotacionados a cada iteração
+        self.has_reference = False
+        self.reference_blur_kernel = None
+        self.frame_delta = None
+        self.thresh = None
+        self.dilated = None
         self.last_alert_time = 0
-        self.ALERT_COOLDOWN = 5 # Segundos de espera entre alertas
+        # raise_alert também é chamado pela thread do classificador
+        self.alert_lock = threading.Lock()
+
+    def start_classifier(self):
+        if not OBJECT_MODEL_PATH:
+            return
+        try:
+            self.classifier = ObjectClassifier(self.raise_alert)
+            self.classifier.start()
+            print(f"Classificador de objetos carregado: {OBJECT_MODEL_PATH} (classes de alerta: {list(settings_store.snapshot.object_alert_classes)})")
+        except Exception as e:
+            self.classifier = None
+            print(f"Erro ao carregar o classificador de objetos, usando apenas detecção de movimento: {e}")
+
+    def start_hls_encoder(self):
+        if not HLS_ENABLED:
+            return
+        width = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if not width or not height:
+            print("Erro: não foi possível obter a resolução da câmera para o encoder HLS.")
+            return
+        try:
+            self.hls_encoder = HlsEncoder(width, height)
+            self.hls_encoder.start_ffmpeg()
+            self.hls_encoder.start()
+        except (OSError, ValueError) as e:
+            self.hls_encoder = None
+            print(f"Erro ao iniciar o encoder HLS (ffmpeg está instalado?): {e}")
+
+    def ensure_buffers(self, frame):
+        # (Re)aloca os buffers de processamento apenas na primeira leitura ou se a resolução mudar
+        shape = frame.shape[:2]
+        if self.gray is not None and self.gray.shape == shape:
+            return
+        self.gray = np.empty(shape, dtype=np.uint8)
+        self.blurred = [np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)]
+        self.has_reference = False
+        self.frame_delta = np.empty(shape, dtype=np.uint8)
+        self.thresh = np.empty(shape, dtype=np.uint8)
+        self.dilated = np.empty(shape, dtype=np.uint8)
 
     def run(self):
-        global monitoring_active, processing_paused, latest_frame, recent_alerts, frame_lock, alerts_lock, ALERT_THRESHOLD, config_lock
+        global monitoring_active, processing_paused, latest_frame, frame_lock
 
         print("Thread da câmera iniciado.")
         self.camera = cv2.VideoCapture(0)
@@ -139,53 +647,71 @@ class CameraThread(threading.Thread):
             monitoring_active = False
             return
 
+        self.start_classifier()
+        self.start_hls_encoder()
+
         while monitoring_active:
-            ret, frame = self.camera.read()
+            # Lê no buffer que não está publicado; o OpenCV reaproveita o array se o tamanho bater
+            ret, frame = self.camera.read(self.capture_buffers[self.capture_index])
             if not ret:
                 print("Erro: Falha ao ler o frame da câmera.")
                 time.sleep(0.1)
                 continue
+            self.capture_buffers[self.capture_index] = frame
 
-            # Atualiza o frame para o /video_feed IMEDIATAMENTE após a leitura
+            # Atualiza o frame para o /video_feed IMEDIATAMENTE após a leitura, trocando a referência
+            # em vez de copiar. O frame publicado não é mais escrito até a próxima troca.
             with frame_lock:
-                latest_frame = frame.copy()
+                latest_frame = frame
+            self.capture_index ^= 1
 
-            # Verifica se o processamento está pausado
-            with config_lock:
-                if processing_paused:
-                    self.last_frame_gray = None # Reseta o frame de referência ao pausar
-                    time.sleep(0.05)
-                    continue # Pula a detecção e alerta se pausado
+            # Verifica se o processamento está pausado (leitura de um bool, não precisa de lock)
+            if processing_paused:
+                self.has_reference = False # Reseta o frame de referência ao pausar
+                time.sleep(0.05)
+                continue # Pula a detecção e alerta se pausado
 
-            # Continue with motion detection processing on the captured frame
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (21, 21), 0)
+            # Um único snapshot das configurações por frame, sem lock
+            settings = settings_store.snapshot
 
-            if self.last_frame_gray is None:
-                self.last_frame_gray = gray
+            # Continue with motion detection processing on the captured frame
+            self.ensure_buffers(frame)
+            previous, current = self.blurred
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+            cv2.GaussianBlur(self.gray, (settings.blur_kernel, settings.blur_kernel), 0, dst=current)
+
+            # Frames borrados com kernels diferentes não são comparáveis
+            if settings.blur_kernel != self.reference_blur_kernel:
+                self.has_reference = False
+                self.reference_blur_kernel = settings.blur_kernel
+
+            if not self.has_reference:
+                self.blurred = [current, previous]
+                self.has_reference = True
                 time.sleep(0.05)
                 continue
 
-            frame_delta = cv2.absdiff(self.last_frame_gray, gray)
-            thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-            thresh = cv2.dilate(thresh, None, iterations=2)
-            contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            cv2.absdiff(previous, current, dst=self.frame_delta)
+            cv2.threshold(self.frame_delta, settings.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self.thresh)
+            cv2.dilate(self.thresh, None, dst=self.dilated, iterations=settings.dilate_iterations)
+            # findContours não modifica a imagem de entrada (OpenCV >= 3.2), então não é preciso copiar
+            contours, _ = cv2.findContours(self.dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
             max_motion_score = 0
-            motion_detected = False
+            motion_boxes = []
             for contour in contours:
-                if cv2.contourArea(contour) < 500:
+                if cv2.contourArea(contour) < settings.min_area:
                     continue
-                motion_detected = True
-                (x, y, w, h) = cv2.boundingRect(contour)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                motion_boxes.append(cv2.boundingRect(contour))
                 current_score = cv2.contourArea(contour)
                 if current_score > max_motion_score:
                     max_motion_score = current_score
+            motion_detected = bool(motion_boxes)
 
-            self.last_frame_gray = gray
+            # O frame atual vira a referência; o antigo será sobrescrito na próxima iteração
+            self.blurred = [current, previous]
 
-            normalized_score = min(round((max_motion_score / 50000) * 100), 100)
+            normalized_score = min(round((max_motion_score / settings.score_normalizer) * 100), 100)
 
             # Added debug log for motion scores
             if motion_detected:
@@ -193,41 +719,63 @@ class CameraThread(threading.Thread):
 
             # Se o score ultrapassar o limite definido pelo usuário e o cooldown tiver passado, gera um alerta
             current_time = time.time()
-            with config_lock:
-                current_threshold = ALERT_THRESHOLD
-
-            if motion_detected and normalized_score >= current_threshold and (current_time - self.last_alert_time) > self.ALERT_COOLDOWN:
-                self.last_alert_time = current_time
-                print(f"ALERTA GERADO! Score: {normalized_score} (Limite: {current_threshold})")
-
-                # Codifica a imagem do alerta para base64
-                _, buffer = cv2.imencode('.jpg', frame)
-                jpg_as_text = base64.b64encode(buffer).decode('ascii')
-
-                alert_data = {
-                    "image": f"data:image/jpeg;base64,{jpg_as_text}",
-                    "score": normalized_score,
-                    "timestamp": int(current_time * 1000)
-                }
-
-                # Add alert data to recent_alerts for frontend display
-                with alerts_lock:
-                    recent_alerts.append(alert_data)
-
-                # Envia o e-mail de alerta diretamente em uma nova thread
-                print("DEBUG: Tentando enviar alerta por email diretamente.")
-                try:
-                    email_thread = threading.Thread(target=send_email_alert, args=(alert_data,))
-                    email_thread.start()
-                    print("DEBUG: Thread para envio de e-mail de alerta iniciada.")
-                except Exception as e:
-                    print(f"DEBUG: Erro ao iniciar a thread de envio de e-mail: {e}")
+            if motion_detected and normalized_score >= settings.alert_threshold and (current_time - self.last_alert_time) > settings.alert_cooldown:
+                if self.classifier is not None:
+                    # O classificador recebe o frame sem as marcações de movimento; se estiver ocupado, o pedido é descartado
+                    self.classifier.submit(frame, motion_boxes, normalized_score, current_time)
+                else:
+                    # O frame está publicado no /video_feed, então as marcações são feitas em uma cópia
+                    alert_frame = frame.copy()
+                    for (x, y, w, h) in motion_boxes:
+                        cv2.rectangle(alert_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                    self.raise_alert(alert_frame, normalized_score, current_time)
 
             # Removed time.sleep(0.02) here
 
+        if self.classifier is not None:
+            self.classifier.stop()
+            self.classifier.join()
+        if self.hls_encoder is not None:
+            self.hls_encoder.stop()
         self.camera.release()
         print("Thread da câmera finalizado e câmera liberada.")
 
+    def raise_alert(self, frame, score, current_time, objects=None):
+        global recent_alerts, alerts_lock
+        settings = settings_store.snapshot
+        # O classificador responde de forma assíncrona, então o cooldown é verificado novamente aqui.
+        # A verificação no loop da câmera é só um filtro prévio; esta, sob alert_lock, é a que vale.
+        with self.alert_lock:
+            if (current_time - self.last_alert_time) <= settings.alert_cooldown:
+                return
+            self.last_alert_time = current_time
+        print(f"ALERTA GERADO! Score: {score} (Limite: {settings.alert_threshold})" + (f" Objetos: {objects}" if objects else ""))
+
+        # Codifica a imagem do alerta para base64
+        _, buffer = cv2.imencode('.jpg', frame)
+        jpg_as_text = base64.b64encode(buffer).decode('ascii')
+
+        alert_data = {
+            "image": f"data:image/jpeg;base64,{jpg_as_text}",
+            "score": score,
+            "timestamp": int(current_time * 1000)
+        }
+        if objects:
+            alert_data["objects"] = objects
+
+        # Add alert data to recent_alerts for frontend display
+        with alerts_lock:
+            recent_alerts.append(alert_data)
+
+        # Envia o e-mail de alerta diretamente em uma nova thread
+        print("DEBUG: Tentando enviar alerta por email diretamente.")
+        try:
+            email_thread = threading.Thread(target=send_email_alert, args=(alert_data,))
+            email_thread.start()
+            print("DEBUG: Thread para envio de e-mail de alerta iniciada.")
+        except Exception as e:
+            print(f"DEBUG: Erro ao iniciar a thread de envio de e-mail: {e}")
+
 @app.route('/video_feed')
 @jwt_required()
 def video_feed():
@@ -251,6 +799,27 @@ def video_feed():
         return Response("Monitoramento não ativo.", status=400)
     return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+def hls_available():
+    return camera_thread is not None and camera_thread.hls_encoder is not None and camera_thread.hls_encoder.is_alive()
+
+@app.route('/live/index.m3u8')
+@jwt_required()
+def live_playlist():
+    if not hls_available() or not os.path.exists(os.path.join(HLS_DIR, HLS_PLAYLIST)):
+        return jsonify({"error": "Transmissão HLS não ativa"}), 404
+    response = send_from_directory(HLS_DIR, HLS_PLAYLIST, mimetype=HLS_MIMETYPES['.m3u8'])
+    # A playlist muda a cada segmento, então nunca deve ser cacheada
+    response.headers['Cache-Control'] = 'no-cache, no-store'
+    return response
+
+@app.route('/live/<segment>')
+@jwt_required()
+def live_segment(segment):
+    extension = os.path.splitext(segment)[1]
+    if not hls_available() or extension not in ('.m4s', '.mp4'):
+        return jsonify({"error": "Segmento não encontrado"}), 404
+    # send_from_directory rejeita caminhos fora de HLS_DIR e responde 404 se o segmento já foi removido
+    return send_from_directory(HLS_DIR, segment, mimetype=HLS_MIMETYPES[extension])
 
 # Endpoint para o frontend verificar se há novos alertas
 @app.route('/check_alerts')
@@ -297,18 +866,16 @@ def login():
 @app.route('/pause_monitoring')
 @jwt_required()
 def pause_monitoring():
-    global processing_paused, config_lock
-    with config_lock:
-        processing_paused = True
+    global processing_paused
+    processing_paused = True
     print("Processamento de monitoramento pausado no backend.")
     return jsonify({'status': 'Processamento pausado'})
 
 @app.route('/resume_monitoring')
 @jwt_required()
 def resume_monitoring():
-    global processing_paused, config_lock
-    with config_lock:
-        processing_paused = False
+    global processing_paused
+    processing_paused = False
     print("Processamento de monitoramento retomado no backend.")
     return jsonify({'status': 'Processamento retomado'})
 
@@ -348,22 +915,44 @@ def stop_monitoring():
 @app.route('/set_threshold', methods=['POST'])
 @jwt_required()
 def set_threshold():
-    global ALERT_THRESHOLD, config_lock
     if not request.json or 'threshold' not in request.json:
         return jsonify({"error": "Missing threshold value"}), 400
     
     try:
         new_threshold = int(request.json['threshold'])
-        if not 0 <= new_threshold <= 100:
-            raise ValueError("Threshold must be between 0 and 100")
-        
-        with config_lock:
-            ALERT_THRESHOLD = new_threshold
+        settings_store.update(alert_threshold=new_threshold)
         
         print(f"Limite de alerta atualizado para: {new_threshold}%")
         return jsonify({"status": "Threshold updated", "new_threshold": new_threshold})
     except (ValueError, TypeError):
         return jsonify({"error": "Invalid threshold value"}), 400
+    except OSError as e:
+        print(f"Erro ao salvar o limite de alerta: {e}")
+        return jsonify({"error": "Failed to save configuration"}), 500
+
+@app.route('/detector_settings', methods=['GET', 'POST'])
+@jwt_required()
+def detector_settings():
+    if request.method == 'GET':
+        return jsonify(settings_store.snapshot.detector())
+
+    if not isinstance(request.json, dict) or not request.json:
+        return jsonify({"error": "Request body must be a non-empty JSON object"}), 400
+
+    unknown = [key for key in request.json if key not in DETECTOR_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown settings: {', '.join(unknown)}"}), 400
+
+    try:
+        settings = settings_store.update(**request.json)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        print(f"Erro ao salvar as configurações do detector: {e}")
+        return jsonify({"error": "Failed to save configuration"}), 500
+
+    print(f"Configurações do detector atualizadas: {request.json}")
+    return jsonify({"status": "Detector settings updated", "settings": settings.detector()})
 
 @app.route('/get_recovery_email', methods=['GET'])
 @jwt_required()
@@ -374,16 +963,22 @@ def get_recovery_email():
 @app.route('/update_recovery_email', methods=['POST'])
 @jwt_required()
 def update_recovery_email():
-    global RECOVERY_EMAIL, app_config
+    global RECOVERY_EMAIL
     if not request.json or 'email' not in request.json:
         return jsonify({"error": "Missing email value"}), 400
     
     new_email = request.json['email']
     # Adicionar validação básica de formato de e-mail aqui se necessário
     
+    try:
+        settings_store.update(recovery_email=new_email)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid email value"}), 400
+    except OSError as e:
+        print(f"Erro ao salvar o e-mail de recuperação: {e}")
+        return jsonify({"error": "Failed to save configuration"}), 500
+    # Só atualiza a memória depois que o config.json foi gravado
     RECOVERY_EMAIL = new_email
-    app_config['recovery_email'] = new_email
-    save_config(app_config)
     
     print(f"E-mail de recuperação atualizado para: {new_email}")
     return jsonify({"status": "Recovery email updated", "new_email": new_email})
@@ -458,6 +1053,8 @@ def send_email_alert(alert_data):
         msg['To'] = recovery_email
 
         body = f"Movimento detectado com intensidade de {alert_data['score']}% às {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(alert_data['timestamp'] / 1000))}"
+        if alert_data.get('objects'):
+            body += f"\nObjetos identificados: {', '.join(alert_data['objects'])}"
         msg.attach(MIMEText(body, 'plain'))
 
         # Anexar imagem, se disponível
@@ -579,19 +1176,18 @@ def test_smtp_connection():
 @jwt_required()
 def get_smtp_config():
     print("DEBUG: Acessando endpoint /get_smtp_config") # Added debug log
-    config = load_config()
+    settings = settings_store.snapshot
     smtp_config = {
-        'smtp_server': config.get('smtp_server', ''),
-        'smtp_port': config.get('smtp_port', 465),
-        'smtp_user': config.get('smtp_user', ''),
-        'smtp_password': config.get('smtp_password', '')
+        'smtp_server': settings.smtp_server,
+        'smtp_port': settings.smtp_port,
+        'smtp_user': settings.smtp_user,
+        'smtp_password': settings.smtp_password
     }
     return jsonify(smtp_config)
 
 @app.route('/update_smtp_config', methods=['POST', 'OPTIONS'])
 @jwt_required()
 def update_smtp_config():
-    global app_config, config_lock
     if request.method == 'OPTIONS':
         # Responder a requisições OPTIONS com 200 OK e os headers CORS apropriados
         return jsonify({'status': 'options'}), 200
@@ -608,12 +1204,13 @@ def update_smtp_config():
     if not all([smtp_server, smtp_port, smtp_user, smtp_password]):
         return jsonify({"error": "Missing SMTP configuration fields"}), 400
 
-    with config_lock:
-        app_config['smtp_server'] = smtp_server
-        app_config['smtp_port'] = smtp_port
-        app_config['smtp_user'] = smtp_user
-        app_config['smtp_password'] = smtp_password
-        save_config(app_config)
+    try:
+        settings_store.update(smtp_server=smtp_server, smtp_port=smtp_port, smtp_user=smtp_user, smtp_password=smtp_password)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid SMTP configuration"}), 400
+    except OSError as e:
+        print(f"Erro ao salvar as configurações de SMTP: {e}")
+        return jsonify({"error": "Failed to save configuration"}), 500
 
     print("Configurações de SMTP atualizadas.")
     return jsonify({"status": "SMTP configuration updated"})